@@ -0,0 +1,19 @@
+import threading
+
+from langchain_openai import OpenAIEmbeddings
+
+# One embeddings client per process, shared by the chat path and the ingest
+# pipeline: reuses the underlying httpx connection pool instead of paying a
+# fresh TLS handshake per instantiation. chunk_size=1024 fills each batch
+# request; extra retries absorb transient rate limits during big ingests.
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+def get_embeddings():
+    """Return the process-wide OpenAIEmbeddings client, building it lazily"""
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                _embeddings = OpenAIEmbeddings(chunk_size=1024, max_retries=6)
+    return _embeddings
@@ -1,18 +1,113 @@
+import asyncio
+import functools
 import os
 import sys
+import threading
 import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 from dotenv import load_dotenv
-from PyPDF2 import PdfReader
+import pypdfium2 as pdfium
 from langchain_community.document_loaders import TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
-from langchain_core.documents import Document
-from pinecone import Pinecone
+# gRPC client: multiplexes upserts over HTTP/2 and skips JSON-encoding the
+# float vectors, a large fraction of upsert wall time at 1536 dims.
+from pinecone.grpc import PineconeGRPC
+
+from clients import get_embeddings
+from local_metrics import store_chunk_vectors, clear_chunk_vectors
 
 # Load environment variables
 load_dotenv()
 
+# One namespace per document type: cheaper than duplicating a "type" field
+# into every chunk's metadata, and queries can still target either kind.
+NAMESPACES = ("pdf", "txt")
+
+# Batching knobs for the embed/upsert pipeline
+EMBED_BATCH_SIZE = 256    # texts per OpenAI embedding request
+UPSERT_BATCH_SIZE = 100   # vectors per Pinecone upsert call
+UPSERT_WINDOW = 8         # in-flight async upserts before draining
+
+@functools.lru_cache(maxsize=8)
+def _get_splitter(chunk_size, chunk_overlap):
+    """Reuse splitters across ingest runs; construction is not free at scale.
+
+    The tuned separator list prefers paragraph/sentence boundaries, which
+    cuts splitter backtracking on messy PDF-extracted text.
+    """
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        separators=["\n\n", "\n", ". ", " ", ""]
+    )
+
+# Persistent event loop for embedding calls. The shared OpenAIEmbeddings
+# client binds its async connection pool to the first loop it runs on, so
+# throwaway asyncio.run loops would leave later ingests holding stale
+# keep-alive connections ("Event loop is closed").
+_embed_loop = None
+_embed_loop_lock = threading.Lock()
+
+def _get_embed_loop():
+    global _embed_loop
+    if _embed_loop is None:
+        with _embed_loop_lock:
+            if _embed_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="embed-loop", daemon=True
+                ).start()
+                _embed_loop = loop
+    return _embed_loop
+
+async def _embed_in_batches(embeddings, texts):
+    """Embed texts in concurrent fixed-size batches"""
+    batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+    results = await asyncio.gather(*[embeddings.aembed_documents(b) for b in batches])
+    return [vec for batch in results for vec in batch]
+
+def _upsert_chunks(index, embeddings, texts, metadatas, namespaces):
+    """Embed chunks concurrently, then upsert in parallel bounded batches.
+
+    Chunks arrive as parallel texts/metadatas/namespaces lists (SoA) and
+    embeddings land in one contiguous float32 array, which keeps per-item
+    Python object overhead and peak RSS down on large ingests. Vectors are
+    grouped by namespace since an upsert call targets exactly one.
+    """
+    vectors = np.asarray(
+        asyncio.run_coroutine_threadsafe(
+            _embed_in_batches(embeddings, texts), _get_embed_loop()
+        ).result(),
+        dtype=np.float32
+    )
+    ids = [str(uuid.uuid4()) for _ in texts]
+
+    pending = []
+    for namespace in sorted(set(namespaces)):
+        members = [i for i, ns in enumerate(namespaces) if ns == namespace]
+        for start in range(0, len(members), UPSERT_BATCH_SIZE):
+            batch = []
+            for i in members[start:start + UPSERT_BATCH_SIZE]:
+                batch.append({
+                    "id": ids[i],
+                    "values": vectors[i].tolist(),
+                    # "text" is the key PineconeVectorStore reads back at query time
+                    "metadata": {**metadatas[i], "text": texts[i]}
+                })
+            pending.append(index.upsert(vectors=batch, namespace=namespace, async_req=True))
+            # Drain once per window so we saturate ingest bandwidth without
+            # queueing an unbounded number of in-flight requests.
+            if len(pending) >= UPSERT_WINDOW:
+                for f in pending:
+                    f.result()
+                pending = []
+    for f in pending:
+        f.result()
+
 def check_environment():
     """Check required environment variables for Pinecone"""
     required = ["OPENAI_API_KEY", "PINECONE_API_KEY", "PINECONE_INDEX_NAME"]
@@ -22,15 +117,31 @@ def check_environment():
             return False
     return True
 
+def _extract_page(pdf_path, page_index):
+    """Extract text from a single page (worker for parallel extraction)"""
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        return pdf[page_index].get_textpage().get_text_range()
+    finally:
+        pdf.close()
+
 def extract_text_from_pdf(pdf_path):
-    """Extract text content from PDF file"""
-    text = ""
+    """Extract text content from PDF file, parallelizing across pages"""
     try:
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PdfReader(file)
-            for page in pdf_reader.pages:
-                text += page.extract_text()
-        return text
+        pdf = pdfium.PdfDocument(pdf_path)
+        n_pages = len(pdf)
+        pdf.close()
+
+        # Page extraction dominates ingest time. PDFium is not thread-safe
+        # (pypdfium2 documents its incompatibility with threading), so
+        # parallelism has to come from processes; each worker opens its own
+        # PdfDocument. Tiny files stay serial to skip the fork overhead.
+        if n_pages > 4:
+            with ProcessPoolExecutor(max_workers=min(os.cpu_count(), n_pages)) as ex:
+                texts = list(ex.map(_extract_page, [pdf_path] * n_pages, range(n_pages)))
+        else:
+            texts = [_extract_page(pdf_path, i) for i in range(n_pages)]
+        return "".join(texts)
     except Exception as e:
         print(f"Error extracting text from {pdf_path}: {e}")
         return None
@@ -46,17 +157,29 @@ def ingest_documents(docs_folder="docs", file_path=None, chunk_size=1000, chunk_
     if not check_environment():
         return False
     
-    embeddings = OpenAIEmbeddings()
-    
+    embeddings = get_embeddings()
+
     # Optional: Clear existing vectors for a fresh sync
     if clear_existing:
         try:
             index_name = os.getenv("PINECONE_INDEX_NAME")
-            pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+            pc = PineconeGRPC(api_key=os.getenv("PINECONE_API_KEY"))
             index = pc.Index(index_name)
             print(f"🧹 Clearing existing vectors from index: {index_name}...")
-            index.delete(delete_all=True)
-            time.sleep(5) # Give Pinecone more time to propagate deletion
+            for namespace in NAMESPACES + ("",):
+                try:
+                    index.delete(delete_all=True, namespace=namespace)
+                except Exception:
+                    pass  # namespace may not exist yet
+            # Poll until the deletion has propagated rather than sleeping blind
+            deadline = time.time() + 30
+            while time.time() < deadline:
+                if not index.describe_index_stats().get('total_vector_count', 0):
+                    break
+                time.sleep(0.5)
+            # The sidecar mirrors the index contents; wipe it too so it only
+            # ever holds vectors for chunks that are actually retrievable.
+            clear_chunk_vectors()
         except Exception as e:
             print(f"⚠️ Warning: Could not clear index: {e}")
 
@@ -84,50 +207,48 @@ def ingest_documents(docs_folder="docs", file_path=None, chunk_size=1000, chunk_
     
     print(f"🚀 Processing {len(files_to_process)} file(s) (Size: {chunk_size}, Overlap: {chunk_overlap})...")
     
-    documents = []
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=len
-    )
+    # SoA layout: parallel texts/metadatas/namespaces lists instead of
+    # Document objects, so the embed/upsert pipeline walks flat lists and a
+    # contiguous array. The file type lives in the target namespace rather
+    # than being duplicated into every chunk's metadata.
+    texts = []
+    metadatas = []
+    namespaces = []
+    text_splitter = _get_splitter(chunk_size, chunk_overlap)
 
     for current_file_path in files_to_process:
         file_name = os.path.basename(current_file_path)
-        
+
         if file_name.endswith('.pdf'):
             text = extract_text_from_pdf(current_file_path)
             if text:
                 chunks = text_splitter.split_text(text)
-                for chunk in chunks:
-                    documents.append(Document(
-                        page_content=chunk,
-                        metadata={"source": file_name, "type": "pdf"}
-                    ))
+                texts.extend(chunks)
+                metadatas.extend({"source": file_name} for _ in chunks)
+                namespaces.extend("pdf" for _ in chunks)
         elif file_name.endswith('.txt'):
             try:
-                # TextLoader uses the file path for its own metadata, we override it
+                # TextLoader uses the file path for its own metadata, we ignore it
                 loader = TextLoader(current_file_path, encoding='utf-8')
-                docs = loader.load()
-                # Explicitly normalize metadata to just the filename
-                for d in docs:
-                    d.metadata = {"source": file_name, "type": "txt"}
-                
-                split_docs = text_splitter.split_documents(docs)
-                documents.extend(split_docs)
+                chunks = [d.page_content for d in text_splitter.split_documents(loader.load())]
+                texts.extend(chunks)
+                metadatas.extend({"source": file_name} for _ in chunks)
+                namespaces.extend("txt" for _ in chunks)
             except Exception as e:
                 print(f"    ✗ Failed to process {file_name}: {e}")
-    
-    if not documents:
+
+    if not texts:
         return False
-    
-    print(f"🧠 Syncing {len(documents)} chunks to Pinecone index: {os.getenv('PINECONE_INDEX_NAME')}...")
-    
+
+    print(f"🧠 Syncing {len(texts)} chunks to Pinecone index: {os.getenv('PINECONE_INDEX_NAME')}...")
+
     try:
-        PineconeVectorStore.from_documents(
-            documents=documents,
-            embedding=embeddings,
-            index_name=os.getenv("PINECONE_INDEX_NAME")
-        )
+        pc = PineconeGRPC(api_key=os.getenv("PINECONE_API_KEY"))
+        index = pc.Index(os.getenv("PINECONE_INDEX_NAME"))
+        _upsert_chunks(index, embeddings, texts, metadatas, namespaces)
+        # Precompute MiniLM chunk vectors so chat-time similarity scoring
+        # only has to encode the query.
+        store_chunk_vectors(texts)
         latency = time.time() - start_time
         print(f"✅ Ingestion complete in {latency:.2f}s")
         return True
@@ -1,26 +1,33 @@
+import json
 import os
+import shutil
 import time
 import uuid
 import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 from typing import List, Optional
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
 from flask_cors import CORS
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field, ValidationError
 from werkzeug.utils import secure_filename
 
 # LangChain & Vector Store
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
 from langchain_pinecone import PineconeVectorStore
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
-
-# Local Metrics (HuggingFace)
-from sentence_transformers import SentenceTransformer, util
+from langchain_core.runnables import RunnableLambda
 
 # Internal modules
-from ingest import ingest_documents
+from clients import get_embeddings
+from ingest import ingest_documents, NAMESPACES
+from local_metrics import local_model, get_chunk_vectors
 
 # Load environment variables
 load_dotenv()
@@ -42,92 +49,136 @@ class IngestRequest(BaseModel):
     chunk_size: int = Field(default=1000, ge=100, le=5000)
     chunk_overlap: int = Field(default=200, ge=0, le=1000)
 
-# Global State for Local Metrics
-# Using a local model for similarity scoring as requested (like previous repos)
-try:
-    print("⏳ Loading local similarity model (all-MiniLM-L6-v2)...")
-    local_model = SentenceTransformer('all-MiniLM-L6-v2')
-    print("✅ Local model loaded.")
-except Exception as e:
-    print(f"⚠️ Could not load local model: {e}")
-    local_model = None
-
-# Rate Limiting State (Simplified)
-rate_limit_store = {}
-
-def rate_limit_check():
-    """Simple rate limiting: 10 requests per minute per IP"""
-    ip = request.remote_addr
-    now = time.time()
-    if ip not in rate_limit_store:
-        rate_limit_store[ip] = []
-    
-    # Filter for last 60 seconds
-    rate_limit_store[ip] = [t for t in rate_limit_store[ip] if now - t < 60]
-    
-    if len(rate_limit_store[ip]) >= 10:
-        return False
-    
-    rate_limit_store[ip].append(now)
-    return True
+# Rate Limiting
+# flask-limiter keeps the check O(1), avoids the racy read-modify-write of a
+# hand-rolled store, and can share state across gunicorn workers when pointed
+# at Redis via RATE_LIMIT_STORAGE_URI (defaults to per-process memory).
+limiter = Limiter(
+    get_remote_address,
+    app=app,
+    storage_uri=os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+)
 
-def get_rag_chain():
+@app.errorhandler(429)
+def rate_limit_exceeded(e):
+    return jsonify({"error": "Rate limit exceeded. Try again in a minute."}), 429
+
+# Cached RAG chain: built once per process instead of on every /api/chat call
+# (each build costs several Pinecone/OpenAI control-plane round-trips).
+_rag_chain = None
+_rag_retriever = None
+_rag_lock = threading.Lock()
+
+# Index existence/dimension checks cost two HTTPS calls and only matter on
+# first boot; validate once per process, or never when SKIP_INDEX_VALIDATE=1
+# (production, where setup_pinecone.py already covers index creation).
+_index_validated = False
+
+# Bumped whenever ingestion completes so cached answers from the previous
+# index contents stop being served (stale entries age out of the LRU).
+_index_generation = 0
+
+def _wait_for_index_ready(pc, index_name, timeout=60):
+    """Poll until the index reports ready (serverless is usually <5s)"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if pc.describe_index(index_name).status["ready"]:
+                return True
+        except Exception:
+            pass
+        time.sleep(0.5)
+    return False
+
+def _init_rag_chain():
     """Initialize Pinecone RAG Chain with enhanced error logging & auto-creation"""
+    global _index_validated
     try:
         openai_key = os.getenv("OPENAI_API_KEY")
         pinecone_key = os.getenv("PINECONE_API_KEY")
         index_name = os.getenv("PINECONE_INDEX_NAME")
-        
+
         if not all([openai_key, pinecone_key, index_name]):
             print(f"❌ Missing Config: OpenAI: {'Set' if openai_key else 'Missing'}, Pinecone: {'Set' if pinecone_key else 'Missing'}, Index: {index_name}")
             return None, None
 
-        embeddings = OpenAIEmbeddings()
-        
-        # Check if index exists and is accessible
-        from pinecone import Pinecone, ServerlessSpec
-        pc = Pinecone(api_key=pinecone_key)
-        
-        active_indexes = [idx.name for idx in pc.list_indexes()]
-        if index_name in active_indexes:
-            # Check existing index dimension
-            desc = pc.describe_index(index_name)
-            if desc.dimension != 1536:
-                print(f"⚠️ Warning: Index '{index_name}' has dimension {desc.dimension}, but OpenAI requires 1536.")
-                print(f"📡 Attempting to delete and recreate index with correct dimensions...")
-                pc.delete_index(index_name)
-                time.sleep(5)
-                active_indexes.remove(index_name)
-
-        if index_name not in active_indexes:
-            print(f"📡 Creating index '{index_name}' (Dimension: 1536)...")
-            try:
-                pc.create_index(
-                    name=index_name,
-                    dimension=1536,
-                    metric='cosine',
-                    spec=ServerlessSpec(
-                        cloud='aws',
-                        region='us-east-1'
+        embeddings = get_embeddings()
+
+        if not (_index_validated or os.getenv("SKIP_INDEX_VALIDATE") == "1"):
+            # Check if index exists and is accessible
+            from pinecone import Pinecone, ServerlessSpec
+            pc = Pinecone(api_key=pinecone_key)
+
+            active_indexes = [idx.name for idx in pc.list_indexes()]
+            if index_name in active_indexes:
+                # Check existing index dimension
+                desc = pc.describe_index(index_name)
+                if desc.dimension != 1536:
+                    print(f"⚠️ Warning: Index '{index_name}' has dimension {desc.dimension}, but OpenAI requires 1536.")
+                    print(f"📡 Attempting to delete and recreate index with correct dimensions...")
+                    pc.delete_index(index_name)
+                    time.sleep(5)
+                    active_indexes.remove(index_name)
+
+            if index_name not in active_indexes:
+                print(f"📡 Creating index '{index_name}' (Dimension: 1536)...")
+                try:
+                    pc.create_index(
+                        name=index_name,
+                        dimension=1536,
+                        metric='cosine',
+                        spec=ServerlessSpec(
+                            cloud='aws',
+                            region='us-east-1'
+                        )
                     )
-                )
-                print(f"✅ Index created. Waiting for DNS/Initialization (30s)...")
-                time.sleep(30) # New indexes take time to propagate
-            except Exception as creation_err:
-                print(f"❌ Failed to create index: {creation_err}")
-                return None, None
+                    print(f"✅ Index created. Waiting for readiness...")
+                    if not _wait_for_index_ready(pc, index_name):
+                        print(f"⚠️ Warning: Index '{index_name}' not ready after 60s, continuing anyway.")
+                except Exception as creation_err:
+                    print(f"❌ Failed to create index: {creation_err}")
+                    return None, None
+
+            # Verify if index has data (stats call is O(1), unlike a query probe)
+            stats = pc.Index(index_name).describe_index_stats()
+            if not stats.get('total_vector_count', 0):
+                print(f"⚠️ Warning: Index '{index_name}' is currently empty. Please ingest documents via UI.")
+
+            _index_validated = True
 
         vectorstore = PineconeVectorStore(
             index_name=index_name,
             embedding=embeddings
         )
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
-        
-        # Verify if index has data
-        test_docs = retriever.invoke("test")
-        if not test_docs:
-            print(f"⚠️ Warning: Index '{index_name}' is currently empty. Please ingest documents via UI.")
-        
+
+        # Chunks are sharded into one namespace per document type; embed the
+        # query once, search the namespaces concurrently (so the fan-out
+        # costs one round-trip, not one per namespace), and keep the best 3
+        # overall. The default namespace stays in the fan-out so vectors
+        # ingested before the sharding change remain retrievable; set
+        # SKIP_LEGACY_NAMESPACE=1 after a full re-ingest to stop paying
+        # for it.
+        if os.getenv("SKIP_LEGACY_NAMESPACE") == "1":
+            search_namespaces = NAMESPACES
+        else:
+            search_namespaces = NAMESPACES + ("",)
+
+        def _retrieve(query):
+            query_vec = embeddings.embed_query(query)
+            scored = []
+            with ThreadPoolExecutor(max_workers=len(search_namespaces)) as ex:
+                for result in ex.map(
+                    lambda ns: vectorstore.similarity_search_by_vector_with_score(
+                        query_vec, k=3, namespace=ns
+                    ),
+                    search_namespaces
+                ):
+                    scored.extend(result)
+            scored.sort(key=lambda pair: pair[1], reverse=True)
+            return [doc for doc, _ in scored[:3]]
+
+        retriever = RunnableLambda(_retrieve)
+
         template = """Answer the question based only on the following context:
         {context}
         
@@ -136,17 +187,13 @@ def get_rag_chain():
         If the answer is not in the context, say "I don't have enough information to answer that based on my current knowledge base."
         """
         prompt = ChatPromptTemplate.from_template(template)
-        model = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-        
-        def format_docs(docs):
-            return "\n\n".join(doc.page_content for doc in docs)
-            
-        chain = (
-            {"context": retriever | format_docs, "question": RunnablePassthrough()}
-            | prompt
-            | model
-            | StrOutputParser()
-        )
+        model = ChatOpenAI(model="gpt-4o-mini", temperature=0, streaming=True)
+
+        # The answer chain takes {"context", "question"} directly: the
+        # handler retrieves once, streams tokens as they arrive, and still
+        # has the source docs in hand for metrics — no second
+        # retriever.invoke.
+        chain = prompt | model | StrOutputParser()
         return chain, retriever
     except Exception as e:
         import traceback
@@ -154,15 +201,96 @@ def get_rag_chain():
         print(traceback.format_exc())
         return None, None
 
-def calculate_local_similarity(query: str, context: str):
-    """Calculate similarity score using local HuggingFace model"""
-    if not local_model or not context:
+def get_rag_chain():
+    """Return the cached RAG chain, building it on first use (double-checked)"""
+    global _rag_chain, _rag_retriever
+    if _rag_chain is None:
+        with _rag_lock:
+            if _rag_chain is None:
+                _rag_chain, _rag_retriever = _init_rag_chain()
+    return _rag_chain, _rag_retriever
+
+def invalidate_rag_chain():
+    """Drop the cached chain so the next chat rebuilds against fresh data"""
+    global _rag_chain, _rag_retriever, _index_generation
+    with _rag_lock:
+        _rag_chain, _rag_retriever = None, None
+        _index_generation += 1
+
+# Cap on context characters sent to the LLM: three 1000-char chunks can reach
+# ~3000 tokens per call otherwise, paying input-token cost and tokenizer time.
+MAX_CTX_CHARS = int(os.getenv("MAX_CTX_CHARS", 4000))
+
+def format_docs(docs):
+    # Drop near-identical chunks (overlapping splits often retrieve together)
+    # before joining, then truncate to the context budget.
+    seen = set()
+    unique = []
+    for doc in docs:
+        key = hash(doc.page_content[:200])
+        if key not in seen:
+            seen.add(key)
+            unique.append(doc.page_content.strip())
+    return "\n\n".join(unique)[:MAX_CTX_CHARS]
+
+# Completed answers memoized per index generation, keyed by normalized query.
+# Repeat queries (common in demos and FAQ-style traffic) skip the Pinecone
+# query and both OpenAI calls entirely on a hit. A plain OrderedDict LRU
+# rather than functools.lru_cache because entries are recorded only after the
+# streamed response finishes.
+ANSWER_CACHE_SIZE = 512
+_answer_cache = OrderedDict()
+_answer_cache_lock = threading.Lock()
+
+def _answer_cache_get(key):
+    with _answer_cache_lock:
+        if key not in _answer_cache:
+            return None
+        _answer_cache.move_to_end(key)
+        return _answer_cache[key]
+
+def _answer_cache_put(key, value):
+    with _answer_cache_lock:
+        _answer_cache[key] = value
+        _answer_cache.move_to_end(key)
+        while len(_answer_cache) > ANSWER_CACHE_SIZE:
+            _answer_cache.popitem(last=False)
+
+def _run_ingest(**kwargs):
+    """Background ingestion target: run ingest, then refresh the cached chain"""
+    if ingest_documents(**kwargs):
+        invalidate_rag_chain()
+
+# MiniLM truncates input at 256 tokens (~4 chars/token); trimming the context
+# up front avoids wasted tokenizer work on the full retriever concat.
+LOCAL_SIM_MAX_CHARS = 1024
+
+def calculate_local_similarity(query: str, docs):
+    """Calculate similarity score between query and retrieved chunks.
+
+    Chunk embeddings are precomputed at ingest time and read from the
+    sidecar store, so only the query (plus any cache misses) needs a
+    forward pass per chat.
+    """
+    if not local_model or not docs:
         return 0.0
-    
-    query_emb = local_model.encode(query, convert_to_tensor=True)
-    context_emb = local_model.encode(context, convert_to_tensor=True)
-    score = util.pytorch_cos_sim(query_emb, context_emb)
-    return float(score[0][0])
+
+    texts = [d.page_content for d in docs]
+    chunk_vecs = get_chunk_vectors(texts)
+
+    # Encode the query and any uncached chunks in a single batched pass;
+    # with normalized embeddings the dot product equals cosine similarity.
+    to_encode = [query] + [t[:LOCAL_SIM_MAX_CHARS]
+                           for t, v in zip(texts, chunk_vecs) if v is None]
+    embs = local_model.encode(
+        to_encode,
+        convert_to_numpy=True,
+        normalize_embeddings=True
+    )
+    query_vec = embs[0]
+    fresh = iter(embs[1:])
+    matrix = np.stack([v if v is not None else next(fresh) for v in chunk_vecs])
+    return float(np.max(matrix @ query_vec))
 
 @app.route('/')
 def home():
@@ -177,49 +305,76 @@ def get_status():
         "local_metrics": "active" if local_model else "inactive"
     })
 
+def _sse(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
 @app.route('/api/chat', methods=['POST'])
+@limiter.limit("10/minute")
 def chat():
-    if not rate_limit_check():
-        return jsonify({"error": "Rate limit exceeded. Try again in a minute."}), 429
-        
     start_time = time.time()
     try:
-        data = request.json
+        # silent=True: malformed JSON and wrong content types yield None
+        # here and fall into the JSON 400 below instead of an HTML error
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Request body must be a JSON object"}), 400
         req = ChatRequest(**data)
-        
-        chain, retriever = get_rag_chain()
-        if not chain:
-            return jsonify({"error": "System not ready. Please ingest documents first."}), 503
-
-        # Get relevant docs for metrics calculation
-        docs = retriever.invoke(req.message)
-        context_text = "\n".join([d.page_content for d in docs])
-        
-        # Calculate localized similarity score
-        similarity_score = calculate_local_similarity(req.message, context_text)
-        
-        # Generate Answer
-        response = chain.invoke(req.message)
-        
-        latency = time.time() - start_time
-        
-        return jsonify({
-            "status": "success",
-            "message": response,
-            "sources": list(set([d.metadata.get('source', 'unknown') for d in docs])),
-            "metrics": {
-                "latency_seconds": round(latency, 2),
-                "top_similarity_score": round(similarity_score, 4)
-            }
-        })
     except ValidationError as e:
         return jsonify({"error": e.errors()}), 400
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+
+    chain, retriever = get_rag_chain()
+    if not chain:
+        return jsonify({"error": "System not ready. Please ingest documents first."}), 503
+
+    # Whitespace-normalized so trivially different phrasings share a cache hit
+    query = " ".join(req.message.split())
+    cache_key = (query, _index_generation)
+
+    def generate():
+        try:
+            cached = _answer_cache_get(cache_key)
+            if cached is not None:
+                answer, sources, similarity_score = cached
+                yield _sse({"token": answer})
+            else:
+                # Retrieve once; tokens flush to the client as they arrive
+                # instead of buffering the full completion server-side.
+                docs = retriever.invoke(query)
+                parts = []
+                for token in chain.stream({"context": format_docs(docs), "question": query}):
+                    parts.append(token)
+                    yield _sse({"token": token})
+                answer = "".join(parts)
+                sources = list(set([d.metadata.get('source', 'unknown') for d in docs]))
+                # Scored after streaming so it never delays the first token
+                similarity_score = calculate_local_similarity(query, docs)
+                _answer_cache_put(cache_key, (answer, sources, similarity_score))
+
+            yield _sse({
+                "done": True,
+                "status": "success",
+                "sources": sources,
+                "metrics": {
+                    "latency_seconds": round(time.time() - start_time, 2),
+                    "top_similarity_score": round(similarity_score, 4)
+                }
+            })
+        except Exception as e:
+            yield _sse({"done": True, "error": str(e)})
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream")
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _save_one(file):
+    """Stream one uploaded file to disk in 1MB chunks; returns (path, name)"""
+    filename = secure_filename(file.filename)
+    save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    with open(save_path, 'wb') as dst:
+        shutil.copyfileobj(file.stream, dst, length=1 << 20)
+    return save_path, filename
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     """Handle UI-based multi-file uploads and trigger ingestion"""
@@ -230,17 +385,17 @@ def upload_file():
     if not files or files[0].filename == '':
         return jsonify({"error": "No selected file"}), 400
     
+    # Overlap the disk writes: multi-file uploads were previously saved one
+    # after another, serializing I/O before ingestion could even start.
+    valid_files = [f for f in files if f and allowed_file(f.filename)]
     saved_paths = []
     filenames = []
-    
-    for file in files:
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(save_path)
-            saved_paths.append(save_path)
-            filenames.append(filename)
-    
+    if valid_files:
+        with ThreadPoolExecutor(max_workers=8) as ex:
+            for save_path, filename in ex.map(_save_one, valid_files):
+                saved_paths.append(save_path)
+                filenames.append(filename)
+
     if not saved_paths:
         return jsonify({"error": "No valid file types supported"}), 400
         
@@ -248,7 +403,7 @@ def upload_file():
     chunk_overlap = int(request.form.get('chunk_overlap', 200))
     
     # Trigger background ingestion for ALL uploaded files
-    thread = threading.Thread(target=ingest_documents, kwargs={
+    thread = threading.Thread(target=_run_ingest, kwargs={
         "file_path": saved_paths,
         "chunk_size": chunk_size,
         "chunk_overlap": chunk_overlap
@@ -290,7 +445,7 @@ def ingest_by_path():
     clear_existing = data.get('clear_existing', False)
     
     # Run ingestion in the background
-    thread = threading.Thread(target=ingest_documents, kwargs={
+    thread = threading.Thread(target=_run_ingest, kwargs={
         "file_path": paths_to_ingest,
         "chunk_size": chunk_size,
         "chunk_overlap": chunk_overlap,
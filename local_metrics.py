@@ -0,0 +1,89 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+# Quantized int8 backends are ~2-3x faster on CPU than the default PyTorch
+# FP32 path with negligible cosine-similarity drift. On Intel hosts with
+# VNNI/AMX, OpenVINO int8 beats ONNX Runtime int8; opt in via
+# LOCAL_BACKEND=openvino (set OV_CACHE_DIR to amortize graph compilation).
+_LOCAL_BACKENDS = {
+    "openvino": {"file_name": "openvino/openvino_model_qint8_quantized.xml"},
+    "onnx": {"file_name": "onnx/model_qint8_avx512_vnni.onnx"},
+    "torch": None,
+}
+
+def _load_local_model():
+    """Load MiniLM with the requested backend, falling back onnx -> torch"""
+    preferred = os.getenv("LOCAL_BACKEND", "onnx").lower()
+    order = [preferred] + [b for b in ("onnx", "torch") if b != preferred]
+    for backend in order:
+        model_kwargs = _LOCAL_BACKENDS.get(backend)
+        try:
+            print(f"⏳ Loading local similarity model (all-MiniLM-L6-v2, {backend})...")
+            if backend == "torch":
+                model = SentenceTransformer('all-MiniLM-L6-v2')
+            else:
+                model = SentenceTransformer(
+                    'all-MiniLM-L6-v2',
+                    backend=backend,
+                    model_kwargs=model_kwargs
+                )
+            print(f"✅ Local model loaded ({backend}).")
+            return model
+        except Exception as e:
+            print(f"⚠️ Could not load {backend} backend: {e}")
+    return None
+
+local_model = _load_local_model()
+
+# Sidecar store of normalized chunk embeddings keyed by content hash, written
+# at ingest time so chat only has to encode the query. Vectors live in a local
+# .npz rather than Pinecone metadata (which caps at 40KB per vector).
+SIDECAR_PATH = os.getenv("MINILM_SIDECAR", "minilm_vectors.npz")
+_vec_lock = threading.Lock()
+_vec_cache = {}
+
+def _content_key(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+def _load_sidecar():
+    global _vec_cache
+    try:
+        if os.path.exists(SIDECAR_PATH):
+            with np.load(SIDECAR_PATH) as data:
+                _vec_cache = {key: data[key] for key in data.files}
+            print(f"✅ Loaded {len(_vec_cache)} cached chunk vectors from {SIDECAR_PATH}")
+    except Exception as e:
+        print(f"⚠️ Could not load MiniLM sidecar: {e}")
+
+_load_sidecar()
+
+def store_chunk_vectors(texts):
+    """Encode chunks (batched, normalized) and persist them to the sidecar"""
+    if not local_model or not texts:
+        return
+    vecs = local_model.encode(
+        texts,
+        batch_size=64,
+        normalize_embeddings=True,
+        convert_to_numpy=True
+    )
+    with _vec_lock:
+        for text, vec in zip(texts, vecs):
+            _vec_cache[_content_key(text)] = vec.astype(np.float32)
+        np.savez_compressed(SIDECAR_PATH, **_vec_cache)
+
+def clear_chunk_vectors():
+    """Drop all cached chunk vectors (pairs with clearing the index)"""
+    with _vec_lock:
+        _vec_cache.clear()
+        if os.path.exists(SIDECAR_PATH):
+            os.remove(SIDECAR_PATH)
+
+def get_chunk_vectors(texts):
+    """Return cached vectors for the given texts (None where missing)"""
+    with _vec_lock:
+        return [_vec_cache.get(_content_key(t)) for t in texts]
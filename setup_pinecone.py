@@ -33,8 +33,13 @@ def setup_index():
             region='us-east-1'
         )
     )
+    # Poll readiness instead of a fixed sleep; serverless is usually <5s
     print("Wait for initialization...")
-    time.sleep(10)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if pc.describe_index(index_name).status["ready"]:
+            break
+        time.sleep(0.5)
     print("Pinecone setup complete.")
 
 if __name__ == "__main__":
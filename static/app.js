@@ -166,27 +166,32 @@ class JarvisChat {
                 body: JSON.stringify({ message: message })
             });
 
-            const data = await response.json();
+            const contentType = response.headers.get('content-type') || '';
+            if (!response.ok || !contentType.includes('text/event-stream')) {
+                // Validation / readiness / rate-limit errors come back as JSON
+                const data = await response.json();
+                throw new Error(data.error || 'Failed to get response');
+            }
 
-            if (response.ok && data.status === 'success') {
-                // Update metrics board
-                if (data.metrics) {
-                    this.latencyMetric.textContent = data.metrics.latency_seconds;
-                    this.similarityMetric.textContent = data.metrics.top_similarity_score;
-                }
+            // Stream tokens into a live bubble as the server flushes them
+            const { answer, finalEvent } = await this.consumeChatStream(response);
 
-                // Add assistant response to UI
-                setTimeout(() => {
-                    this.hideTypingIndicator();
-                    this.addMessageToUI(data.message, 'assistant', data.sources);
-                    this.isTyping = false;
-                    this.setSendButtonState('ready');
-                    this.messageInput.focus();
-                }, 800); // Small delay for better UX
-            } else {
-                throw new Error(data.error || 'Failed to get response');
+            if (finalEvent && finalEvent.error) {
+                throw new Error(finalEvent.error);
             }
 
+            // Update metrics board
+            if (finalEvent && finalEvent.metrics) {
+                this.latencyMetric.textContent = finalEvent.metrics.latency_seconds;
+                this.similarityMetric.textContent = finalEvent.metrics.top_similarity_score;
+            }
+
+            // Re-render the finished answer with full formatting + sources
+            this.addMessageToUI(answer, 'assistant', finalEvent ? finalEvent.sources : []);
+            this.isTyping = false;
+            this.setSendButtonState('ready');
+            this.messageInput.focus();
+
         } catch (error) {
             this.hideTypingIndicator();
             this.showError(error.message);
@@ -195,6 +200,51 @@ class JarvisChat {
         }
     }
 
+    async consumeChatStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let answer = '';
+        let finalEvent = null;
+        let streamDiv = null;
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split('\n\n');
+            buffer = events.pop(); // keep any partial event for the next read
+
+            for (const event of events) {
+                if (!event.startsWith('data: ')) continue;
+                const payload = JSON.parse(event.slice(6));
+
+                if (payload.token) {
+                    if (!streamDiv) {
+                        this.hideTypingIndicator();
+                        streamDiv = document.createElement('div');
+                        streamDiv.className = 'assistant-message';
+                        this.chatMessages.appendChild(streamDiv);
+                    }
+                    answer += payload.token;
+                    streamDiv.textContent = answer;
+                    this.scrollToBottom();
+                }
+                if (payload.done) {
+                    finalEvent = payload;
+                }
+            }
+        }
+
+        // addMessageToUI renders the formatted version; drop the raw bubble
+        this.hideTypingIndicator();
+        if (streamDiv) {
+            streamDiv.remove();
+        }
+        return { answer, finalEvent };
+    }
+
     addMessageToUI(content, sender, sources = []) {
         // Remove welcome message if it's the first real message
         const welcomeMessage = this.chatMessages.querySelector('.welcome-message');